@@ -14,6 +14,7 @@
 
 
 #include <cuda_runtime.h>
+#include <vector>
 
 #include "dali/plugin/copy.h"
 #include "dali/core/error_handling.h"
@@ -107,6 +108,46 @@ void CopyToExternalTensor(const Tensor<GPUBackend>& t,
                                          volume(t.shape()) * t.type().size(),
                                          stream, non_blocking);
 }
+
+void CopyToExternalTensors(const std::vector<const Tensor<GPUBackend>*>& tensors,
+                           const std::vector<void*>& ptrs,
+                           device_type_t dst_type,
+                           cudaStream_t stream,
+                           bool non_blocking) {
+  DALI_ENFORCE(tensors.size() == ptrs.size(),
+               "Number of tensors and destination pointers must match!");
+  if (tensors.empty()) {
+    return;
+  }
+  cudaMemcpyKind direction;
+  if (dst_type == GPU) {
+    direction = cudaMemcpyDeviceToDevice;
+  } else if (dst_type == CPU) {
+    direction = cudaMemcpyDeviceToHost;
+  } else {
+    DALI_FAIL("Coping from GPUBackend to device type " + to_string(dst_type));
+  }
+  int device_id = tensors[0]->device_id();
+  std::vector<void*> srcs(tensors.size());
+  std::vector<size_t> sizes(tensors.size());
+  for (size_t i = 0; i < tensors.size(); ++i) {
+    const auto &t = *tensors[i];
+    DALI_ENFORCE(t.ndim() > 0, "Can't copy empty Tensor!");
+    DALI_ENFORCE(t.device_id() == device_id,
+                 "All tensors copied together must reside on the same device!");
+    srcs[i] = const_cast<void*>(t.raw_data());
+    sizes[i] = volume(t.shape()) * t.type().size();
+  }
+
+  DeviceGuard d(device_id);
+  for (size_t i = 0; i < tensors.size(); ++i) {
+    CUDA_CALL(cudaMemcpyAsync(ptrs[i], srcs[i], sizes[i], direction, stream));
+  }
+  if (!non_blocking) {
+    CUDA_CALL(cudaStreamSynchronize(stream));
+  }
+}
+
 void CopyToExternalTensor(TensorList<CPUBackend>* tl,
                           void* ptr,
                           device_type_t dst_type,
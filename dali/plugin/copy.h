@@ -15,6 +15,7 @@
 #ifndef DALI_PLUGIN_COPY_H_
 #define DALI_PLUGIN_COPY_H_
 
+#include <vector>
 #include "dali/pipeline/data/tensor_list.h"
 #include "dali/pipeline/data/tensor.h"
 
@@ -47,6 +48,17 @@ DLL_PUBLIC void CopyToExternalTensor(const Tensor<GPUBackend>& tl,
                                      cudaStream_t stream = 0,
                                      bool non_blocking = false);
 
+/**
+ * @brief Copies a number of GPU tensors residing on the same device to external
+ *        pointers. The copies are issued one by one on `stream`, only the
+ *        synchronization with it (skipped if `non_blocking`) is done once for all of them.
+ */
+DLL_PUBLIC void CopyToExternalTensors(const std::vector<const Tensor<GPUBackend>*>& tensors,
+                                      const std::vector<void*>& ptrs,
+                                      device_type_t dst_type,
+                                      cudaStream_t stream = 0,
+                                      bool non_blocking = false);
+
 }  // namespace dali
 
 #endif  // DALI_PLUGIN_COPY_H_
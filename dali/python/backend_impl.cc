@@ -162,7 +162,9 @@ void ExposeTensor(py::module &m) {
     .def("layout", &Tensor<CPUBackend>::GetLayout)
     .def("copy_to_external",
         [](Tensor<CPUBackend> &t, py::object p) {
-          CopyToExternalTensor(t, ctypes_void_ptr(p), CPU, 0, false);
+          void *ptr = ctypes_void_ptr(p);
+          py::gil_scoped_release interpreter_unlock{};
+          CopyToExternalTensor(t, ptr, CPU, 0, false);
         },
       "ptr"_a,
       R"code(
@@ -197,6 +199,7 @@ void ExposeTensor(py::module &m) {
           cudaStream_t stream = static_cast<cudaStream_t>(
             ctypes_void_ptr(cuda_stream));
 
+          py::gil_scoped_release interpreter_unlock{};
           CopyToExternalTensor(t, ptr, GPU, stream, non_blocking);
         },
       "ptr"_a,
@@ -221,6 +224,41 @@ void ExposeTensor(py::module &m) {
       R"code(
       String representing NumPy type of the Tensor.
       )code");
+
+  m.def("CopyToExternalTensors",
+        [](const std::vector<Tensor<GPUBackend>*> &tensors, py::list ptrs,
+           py::object cuda_stream, bool non_blocking) {
+          std::vector<const Tensor<GPUBackend>*> srcs(tensors.begin(), tensors.end());
+          std::vector<void*> dsts;
+          for (auto p : ptrs) {
+            dsts.push_back(ctypes_void_ptr(py::reinterpret_borrow<py::object>(p)));
+          }
+          cudaStream_t stream = static_cast<cudaStream_t>(
+            ctypes_void_ptr(cuda_stream));
+
+          py::gil_scoped_release interpreter_unlock{};
+          CopyToExternalTensors(srcs, dsts, GPU, stream, non_blocking);
+        },
+      "tensors"_a,
+      "ptrs"_a,
+      "cuda_stream"_a = 0,
+      "non_blocking"_a = false,
+      R"code(
+      Copy a list of `TensorGPU` residing on the same device to external pointers
+      in the GPU memory. The copies are issued one by one, as with `copy_to_external`,
+      and only the synchronization with `cuda_stream` is done once for all of them.
+
+      Parameters
+      ----------
+      tensors : list of TensorGPU
+            Sources of the copy.
+      ptrs : list of ctypes.c_void_p
+            Destinations of the copy, one for each tensor.
+      cuda_stream : ctypes.c_void_p
+            CUDA stream to schedule the copies on (default stream if not provided).
+      non_blocking : bool
+            Asynchronous copy.
+      )code");
 }
 void ExposeTensorList(py::module &m) {
   // We only want to wrap buffers w/ TensorLists to feed then to
@@ -716,7 +754,12 @@ PYBIND11_MODULE(backend_impl, m) {
     .def("ShareOutputs",
         [](Pipeline *p) {
           DeviceWorkspace ws;
-          p->ShareOutputs(&ws);
+          {
+            // Waiting for the outputs may take a while, let other Python threads
+            // (e.g. ones driving other pipelines) run in the meantime
+            py::gil_scoped_release interpreter_unlock{};
+            p->ShareOutputs(&ws);
+          }
 
           py::list list;
           for (int i = 0; i < ws.NumOutput(); ++i) {
@@ -17,10 +17,38 @@ from __future__ import division
 from __future__ import print_function
 from nvidia.dali.pipeline import Pipeline
 from nvidia.dali import types
+from nvidia.dali.backend import TensorGPU, CopyToExternalTensors
 import mxnet as mx
 import ctypes
 import logging
 import numpy as np
+import threading
+import weakref
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+
+# Numpy types corresponding to type strings returned by DALI tensors' dtype()
+_DALI_TO_NP = {
+    "=b" : np.dtype(np.int8),
+    "=B" : np.dtype(np.uint8),
+    "=h" : np.dtype(np.int16),
+    "=H" : np.dtype(np.uint16),
+    "=i" : np.dtype(np.int32),
+    "=I" : np.dtype(np.uint32),
+    "=q" : np.dtype(np.int64),
+    "=Q" : np.dtype(np.uint64),
+    "=e" : np.dtype(np.float16),
+    "=f" : np.dtype(np.float32),
+    "=d" : np.dtype(np.float64)
+}
+
+def _to_np_dtype(dali_dtype):
+    np_dtype = _DALI_TO_NP.get(dali_dtype)
+    if np_dtype is None:
+        # Less common types are left to numpy to figure out
+        np_dtype = np.dtype(dali_dtype)
+    return np_dtype
 
 # MXNet currently does not expose WaitToWrite C API call
 # in Python API
@@ -29,27 +57,84 @@ def _wait_to_write(arr):
         raise RuntimeError("Can only wait for NDArray")
     mx.base._LIB.MXNDArrayWaitToWrite(arr.handle)
 
-def feed_ndarray(dali_tensor, arr):
+def _data_ptr(arr):
+    # Get CTypes void pointer to the underlying memory held by arr
+    ptr = ctypes.c_void_p()
+    mx.base._LIB.MXNDArrayGetData(arr.handle, ctypes.byref(ptr))
+    return ptr
+
+def _feed_ndarrays(dali_tensors, arrs, ptrs, gpu_mask, needs_wait):
+    # Bit j of `gpu_mask` is set if j-th tensor is placed in the GPU memory
+    if needs_wait:
+        # Wait until all arrays are no longer used by the engine
+        for a in arrs:
+            _wait_to_write(a)
+    gpu_tensors = []
+    gpu_ptrs = []
+    for j, (t, a, ptr) in enumerate(zip(dali_tensors, arrs, ptrs)):
+        assert t.shape() == list(a.shape), \
+                ("Shapes do not match: DALI tensor has shape {0}"
+                ", but NDArray has shape {1}".format(t.shape(), list(a.shape)))
+        if gpu_mask & (1 << j):
+            gpu_tensors.append(t)
+            gpu_ptrs.append(ptr)
+        else:
+            # Copy data from DALI tensor to ptr
+            t.copy_to_external(ptr)
+    if gpu_tensors:
+        CopyToExternalTensors(gpu_tensors, gpu_ptrs)
+
+def feed_ndarray(dali_tensor, arr, needs_wait=True):
     """
     Copy contents of DALI tensor to MXNet's NDArray.
 
+    Lists of tensors and NDArrays can be passed as well, in which case all the copies
+    from GPU tensors (which then have to reside on the same device) are synchronized only once.
+
     Parameters
     ----------
-    `dali_tensor` : nvidia.dali.backend.TensorCPU or nvidia.dali.backend.TensorGPU
-                    Tensor from which to copy
-    `arr` : mxnet.nd.NDArray
-            Destination of the copy
+    `dali_tensor` : nvidia.dali.backend.TensorCPU or nvidia.dali.backend.TensorGPU, or list of those
+                    Tensor(s) from which to copy
+    `arr` : mxnet.nd.NDArray or list of mxnet.nd.NDArray
+            Destination(s) of the copy
+    `needs_wait` : bool, optional, default = True
+                   Whether to wait until MXNet engine no longer uses `arr`.
+                   Can be set to False only when no operation was ever scheduled
+                   on `arr`, e.g. it was just created with `mxnet.nd.empty`
+                   (unlike `mxnet.nd.zeros`, which schedules the fill).
     """
-    # Wait until arr is no longer used by the engine
-    _wait_to_write(arr)
-    assert dali_tensor.shape() == list(arr.shape), \
-            ("Shapes do not match: DALI tensor has shape {0}"
-            ", but NDArray has shape {1}".format(dali_tensor.shape(), list(arr.shape)))
-    # Get CTypes void pointer to the underlying memory held by arr
-    ptr = ctypes.c_void_p()
-    mx.base._LIB.MXNDArrayGetData(arr.handle, ctypes.byref(ptr))
-    # Copy data from DALI tensor to ptr
-    dali_tensor.copy_to_external(ptr)
+    if not isinstance(dali_tensor, (list, tuple)):
+        dali_tensor = [dali_tensor]
+        arr = [arr]
+    assert len(dali_tensor) == len(arr), \
+            ("Number of DALI tensors ({0}) does not match "
+            "the number of NDArrays ({1})".format(len(dali_tensor), len(arr)))
+    gpu_mask = sum(1 << j for j, t in enumerate(dali_tensor) if isinstance(t, TensorGPU))
+    _feed_ndarrays(dali_tensor, arr, [_data_ptr(a) for a in arr], gpu_mask, needs_wait)
+
+def _prefetch_loop(iterator_ref, requests, free_slots):
+    # Fills data batches of the iterator ahead of its consumer. Only a weak
+    # reference to the iterator is kept while waiting, so the abandoned
+    # iterator can still be garbage collected
+    while True:
+        num_batches = requests.get()
+        if num_batches is None:
+            return
+        for _ in range(num_batches):
+            free_slots.acquire()
+            iterator = iterator_ref()
+            if iterator is None or iterator._closed:
+                return
+            try:
+                iterator._prefetch_batch()
+            except Exception as e:
+                # No slot was filled, so give it back. Let the consumer know
+                # that the rest of the epoch will not be produced
+                free_slots.release()
+                iterator._ready.put(e)
+                break
+            finally:
+                iterator = None
 
 class DALIGenericIterator(object):
     """
@@ -61,6 +146,11 @@ class DALIGenericIterator(object):
     still owned by DALI. They are valid till the next iterator call.
     If the content needs to be preserved please copy it to another NDArray.
 
+    Batches are prepared by a background thread while the previously
+    returned one is being consumed. Resources held by the iterator, including
+    that thread, can be released with `close()`, which is also called when
+    the iterator is used as a context manager.
+
     Parameters
     ----------
     pipelines : list of nvidia.dali.pipeline.Pipeline
@@ -103,6 +193,10 @@ class DALIGenericIterator(object):
                  it was consumed but dropped. If set to True next epoch would be the
                  same length as the first one. For this happen, the option `pad_last_batch`
                  in the reader need to be set to `True` as well.
+    prefetch_queue_depth : int, optional, default = 2
+                 Number of data batches kept by the iterator for every pipeline.
+                 The iterator prepares up to `prefetch_queue_depth - 1` batches
+                 ahead of the one returned last. Has to be at least 1.
 
     Example
     -------
@@ -121,27 +215,49 @@ class DALIGenericIterator(object):
                  auto_reset=False,
                  squeeze_labels=True,
                  dynamic_shape=False,
-                 last_batch_padded=False):
+                 last_batch_padded=False,
+                 prefetch_queue_depth=2):
         if not isinstance(pipelines, list):
             pipelines = [pipelines]
         self._num_gpus = len(pipelines)
         assert pipelines is not None, "Number of provided pipelines has to be at least 1"
         self.batch_size = pipelines[0].batch_size
         self._size = int(size)
+        # The first batch is needed to describe the data, so an empty epoch cannot be handled
+        assert self._size > 0, "Size of the epoch has to be positive"
         self._pipes = pipelines
         self._fill_last_batch = fill_last_batch
         self._last_batch_padded = last_batch_padded
         self._auto_reset = auto_reset
         self._squeeze_labels = squeeze_labels
         self._dynamic_shape = dynamic_shape
+        assert prefetch_queue_depth >= 1, "prefetch_queue_depth has to be at least 1"
+        self._ring_depth = prefetch_queue_depth
+        self._prefetch_thread = None
+        # Pipelines are independent of each other, so drive each one from its own thread
+        self._executor = ThreadPoolExecutor(max_workers=self._num_gpus)
+        self._closed = False
         # Build all pipelines
-        for p in self._pipes:
-            with p._check_api_type_scope(types.PipelineAPIType.ITERATOR) as check:
-                p.build()
-        # Use double-buffering of data batches
-        self._data_batches = [[None] for i in range(self._num_gpus)]
+        self._run_on_pipes(self._build_pipeline)
+        # Use multiple-buffering of data batches
+        self._data_batches = [[None] * self._ring_depth for i in range(self._num_gpus)]
+        # NDArrays of the data batches (data first, then labels) and the addresses
+        # of their memory. The arrays are referenced here, and not only through
+        # the DataBatch handed to the user, so they cannot be freed while DALI writes to them
+        self._data_arrays = [[None] * self._ring_depth for i in range(self._num_gpus)]
+        self._data_ptrs = [[None] * self._ring_depth for i in range(self._num_gpus)]
         self._counter = 0
         self._current_data_batch = 0
+        # Shapes and types of the first outputs, per pipeline
+        # (reused for all the batches only for static shapes)
+        self._cached_info = [None] * self._num_gpus
+        # Outputs shared during setup to describe the data, not yet copied, per pipeline
+        self._peeked_outputs = [None] * self._num_gpus
+        # MXNet contexts for the GPU and CPU outputs, per pipeline
+        self._output_devices = [None] * self._num_gpus
+        # Bit j is set if j-th output (data outputs first, then labels) is placed
+        # in the GPU memory, per pipeline
+        self._gpu_out_mask = [None] * self._num_gpus
         self._output_names_map = [x[0] for x in output_map]
         self._output_categories_map = [x[1] for x in output_map]
         self._output_categories = {DALIGenericIterator.DATA_TAG, DALIGenericIterator.LABEL_TAG}
@@ -149,131 +265,237 @@ class DALIGenericIterator(object):
             "Only DATA_TAG and LABEL_TAG are allowed"
         assert len(set(self._output_names_map)) == len(self._output_names_map), \
             "output_names in output_map should be distinct"
+        # Positions of data and label entries among the pipeline outputs
+        self._data_idx = [j for j, c in enumerate(self._output_categories_map) if c == DALIGenericIterator.DATA_TAG]
+        self._label_idx = [j for j, c in enumerate(self._output_categories_map) if c == DALIGenericIterator.LABEL_TAG]
         self.output_map = output_map
 
+        # Batches are produced by a background thread, while the previously returned
+        # ones are being consumed. It may fill a slot of the data batches only after
+        # the consumer has released it, by asking for the next batch
+        self._ready = Queue()
+        self._requests = Queue()
+        self._free_slots = threading.Semaphore(self._ring_depth)
+        self._consumed_slot = None
+        # Error which stopped producing batches in the current epoch
+        self._error = None
+        self._prefetch_thread = threading.Thread(target=_prefetch_loop,
+                                                 args=(weakref.ref(self), self._requests, self._free_slots))
+        self._prefetch_thread.daemon = True
+        self._prefetch_thread.start()
+
         # We need data about the batches (like shape information),
-        # so we need to run a single batch as part of setup to get that info
-        for p in self._pipes:
-            with p._check_api_type_scope(types.PipelineAPIType.ITERATOR) as check:
-                p.schedule_run()
-        self._first_batch = None
-        self._first_batch = self.next()
+        # so we need to wait for the first outputs as part of setup to get that info.
+        # They are only peeked at here, without allocating any NDArrays,
+        # and kept to be copied as the first batch by the background thread
+        self._run_on_pipes(self._schedule_pipeline)
+        self._run_on_pipes(self._peek_pipeline)
+        self._requests.put(self._batches_left())
+        data_info, label_info = self._cached_info[0]
         # Set data descriptors for MXNet
         self.provide_data = []
         self.provide_label = []
 
-        category_names = {key : [] for key in self._output_categories}
-        for name, category in output_map:
-            category_names[category].append(name)
-        for i, data in enumerate(self._first_batch[0].data):
-            data_shape  = (data.shape[0] * self._num_gpus,) + data.shape[1:]
-            self.provide_data.append(mx.io.DataDesc(category_names[DALIGenericIterator.DATA_TAG][i], \
-                data_shape, data.dtype, layout=data_layout))
-        for i, label in enumerate(self._first_batch[0].label):
-            label_shape = (label.shape[0] * self._num_gpus,) + label.shape[1:]
-            self.provide_label.append(mx.io.DataDesc(category_names[DALIGenericIterator.LABEL_TAG][i], \
-                label_shape, label.dtype))
-
+        data_names = [self._output_names_map[j] for j in self._data_idx]
+        label_names = [self._output_names_map[j] for j in self._label_idx]
+        for (shape, dtype), name in zip(data_info, data_names):
+            data_shape  = (shape[0] * self._num_gpus,) + shape[1:]
+            self.provide_data.append(mx.io.DataDesc(name, data_shape, dtype, layout=data_layout))
+        for (shape, dtype), name in zip(label_info, label_names):
+            label_shape = (shape[0] * self._num_gpus,) + shape[1:]
+            self.provide_label.append(mx.io.DataDesc(name, label_shape, dtype))
+
+    def _build_pipeline(self, i):
+        p = self._pipes[i]
+        with p._check_api_type_scope(types.PipelineAPIType.ITERATOR) as check:
+            p.build()
+
+    def _schedule_pipeline(self, i):
+        p = self._pipes[i]
+        with p._check_api_type_scope(types.PipelineAPIType.ITERATOR) as check:
+            p.schedule_run()
+
+    def _peek_pipeline(self, i):
+        p = self._pipes[i]
+        with p._check_api_type_scope(types.PipelineAPIType.ITERATOR) as check:
+            outputs = p.share_outputs()
+        self._peeked_outputs[i] = outputs
+        data_tensors, label_tensors = self._get_tensors(outputs)
+        self._cached_info[i] = self._get_info(data_tensors, label_tensors)
+
+    def _process_pipeline(self, i):
+        p = self._pipes[i]
+        with p._check_api_type_scope(types.PipelineAPIType.ITERATOR) as check:
+            outputs = self._peeked_outputs[i]
+            if outputs is None:
+                outputs = p.share_outputs()
+            else:
+                # Already shared during setup
+                self._peeked_outputs[i] = None
+            # Shapes are checked every batch only if they can change
+            if self._dynamic_shape:
+                self._feed_outputs_dynamic(i, outputs)
+            else:
+                self._feed_outputs_static(i, outputs)
+            p.release_outputs()
+            p.schedule_run()
+
+    def _get_tensors(self, outputs):
+        # MXNet wants batches with clear distinction between
+        # data and label entries, so segregate outputs into
+        # 2 categories and change DALI TensorLists into Tensors
+        # For data proceed normally
+        data_tensors = [outputs[j].as_tensor() for j in self._data_idx]
+        # For labels we squeeze the tensors
+        label_tensors = []
+        for j in self._label_idx:
+            label = outputs[j].as_tensor()
+            if self._squeeze_labels:
+                label.squeeze()
+            label_tensors.append(label)
+        return data_tensors, label_tensors
+
+    def _get_info(self, data_tensors, label_tensors):
+        return ([(tuple(x.shape()), _to_np_dtype(x.dtype())) for x in data_tensors],
+                [(tuple(x.shape()), _to_np_dtype(x.dtype())) for x in label_tensors])
+
+    def _allocate_batch(self, i, data_tensors, label_tensors, data_info, label_info):
+        if self._output_devices[i] is None:
+            self._set_output_devices(i, data_tensors, label_tensors)
+        mx_gpu_device, mx_cpu_device = self._output_devices[i]
+        mask = self._gpu_out_mask[i]
+        # `empty` schedules no operation on the engine (as opposed to e.g. `zeros`),
+        # so nothing can write to these arrays before DALI does
+        d = []
+        l = []
+        for j, (shape, dtype) in enumerate(data_info):
+            d.append(mx.nd.empty(shape, mx_gpu_device if mask & (1 << j) else mx_cpu_device, dtype = dtype))
+        for j, (shape, dtype) in enumerate(label_info, len(data_info)):
+            l.append(mx.nd.empty(shape, mx_gpu_device if mask & (1 << j) else mx_cpu_device, dtype = dtype))
+        batch = mx.io.DataBatch(data=d, label=l)
+        self._data_batches[i][self._current_data_batch] = batch
+        self._data_arrays[i][self._current_data_batch] = d + l
+        # Memory of the NDArray does not move until it is replaced, so resolve its address once.
+        # `empty` allocates it right away and leaves no pending engine operation that could
+        # allocate it concurrently, so it is safe to query it without waiting
+        self._data_ptrs[i][self._current_data_batch] = [_data_ptr(a) for a in d + l]
+        return batch
+
+    def _feed_outputs_static(self, i, outputs):
+        data_tensors, label_tensors = self._get_tensors(outputs)
+        arrays = self._data_arrays[i][self._current_data_batch]
+        ptrs = self._data_ptrs[i][self._current_data_batch]
+        if arrays is not None:
+            # Copy data from DALI Tensors to MXNet NDArrays
+            _feed_ndarrays(data_tensors + label_tensors, arrays, ptrs, self._gpu_out_mask[i], True)
+            return
+        # If we did not yet allocate memory for that batch, do it now.
+        # Shapes and types do not change between iterations, so the ones
+        # read during setup are used
+        data_info, label_info = self._cached_info[i]
+        self._allocate_batch(i, data_tensors, label_tensors, data_info, label_info)
+        arrays = self._data_arrays[i][self._current_data_batch]
+        ptrs = self._data_ptrs[i][self._current_data_batch]
+        # Nothing was scheduled on freshly allocated arrays yet
+        _feed_ndarrays(data_tensors + label_tensors, arrays, ptrs, self._gpu_out_mask[i], False)
+
+    def _feed_outputs_dynamic(self, i, outputs):
+        data_tensors, label_tensors = self._get_tensors(outputs)
+        data_info, label_info = self._get_info(data_tensors, label_tensors)
+        batch = self._data_batches[i][self._current_data_batch]
+        needs_wait = True
+        # If we did not yet allocate memory for that batch, do it now
+        if batch is None:
+            batch = self._allocate_batch(i, data_tensors, label_tensors, data_info, label_info)
+            # Nothing was scheduled on freshly allocated arrays yet
+            needs_wait = False
+        arrays = self._data_arrays[i][self._current_data_batch]
+        ptrs = self._data_ptrs[i][self._current_data_batch]
+        num_data = len(data_info)
+        for j, (shape, dtype) in enumerate(data_info + label_info):
+            if arrays[j].shape != shape:
+                # Use `empty`, so the address can be resolved without waiting for the engine
+                arrays[j] = mx.nd.empty(shape, arrays[j].context, dtype = dtype)
+                ptrs[j] = _data_ptr(arrays[j])
+                if j < num_data:
+                    batch.data[j] = arrays[j]
+                else:
+                    batch.label[j - num_data] = arrays[j]
+        # Copy data from DALI Tensors to MXNet NDArrays
+        _feed_ndarrays(data_tensors + label_tensors, arrays, ptrs, self._gpu_out_mask[i], needs_wait)
+
+    def _set_output_devices(self, i, data_tensors, label_tensors):
+        # Outputs keep residing on the same device, so it is enough to check it once
+        device_id = self._pipes[i].device_id
+        mx_gpu_device = mx.gpu(device_id)
+        if DALIGenericIterator.USE_PINNED_CPU_MEMORY and device_id >= 0:
+            # Page-locked memory lets CPU outputs be moved to the GPU asynchronously
+            mx_cpu_device = mx.cpu_pinned(device_id)
+        else:
+            mx_cpu_device = mx.cpu(0)
+        self._output_devices[i] = (mx_gpu_device, mx_cpu_device)
+        self._gpu_out_mask[i] = sum(1 << j for j, t in enumerate(data_tensors + label_tensors)
+                                    if isinstance(t, TensorGPU))
+
+    def _prefetch_batch(self):
+        # Gather outputs, copy them and schedule the next iteration
+        # for all pipelines in parallel
+        self._run_on_pipes(self._process_pipeline)
+        self._ready.put(self._current_data_batch)
+        # Change index for multiple-buffering
+        self._current_data_batch = (self._current_data_batch + 1) % self._ring_depth
+
+    def _batches_left(self):
+        # Number of batches to be returned before the end of the epoch
+        batch_samples = self._num_gpus * self.batch_size
+        return max(0, (self._size - self._counter + batch_samples - 1) // batch_samples)
+
+    def _run_on_pipes(self, fn):
+        # Results are collected explicitly rather than through `map`, so
+        # exceptions (StopIteration included) propagate to the caller unchanged.
+        # Wait for all the pipelines first, so none of them is still in use
+        # when the error is raised
+        futures = [self._executor.submit(fn, i) for i in range(self._num_gpus)]
+        concurrent.futures.wait(futures)
+        for f in futures:
+            f.result()
+
+    def _get_ready_slot(self):
+        # Nothing more will be produced in this epoch, keep reporting the error until reset
+        if self._error is not None:
+            raise self._error
+        slot = self._ready.get()
+        if isinstance(slot, Exception):
+            self._error = slot
+            raise slot
+        return slot
 
     def __next__(self):
-        if self._first_batch is not None:
-            batch = self._first_batch
-            self._first_batch = None
-            return batch
+        if self._closed:
+            raise RuntimeError("Cannot get data from the closed DALI iterator")
         if self._counter >= self._size:
             if self._auto_reset:
                 self.reset()
             raise StopIteration
-        # Gather outputs
-        outputs = []
-        for p in self._pipes:
-            with p._check_api_type_scope(types.PipelineAPIType.ITERATOR) as check:
-                outputs.append(p.share_outputs())
-        for i in range(self._num_gpus):
-            # MXNet wants batches with clear distinction between
-            # data and label entries, so segregate outputs into
-            # 2 categories
-            category_outputs = {key : [] for key in self._output_categories}
-            for j, out in enumerate(outputs[i]):
-                category_outputs[self._output_categories_map[j]].append(out)
-            # Change DALI TensorLists into Tensors
-            category_tensors = dict()
-            category_info = dict()
-            # For data proceed normally
-            category_tensors[DALIGenericIterator.DATA_TAG] = \
-                [x.as_tensor() for x in category_outputs[DALIGenericIterator.DATA_TAG]]
-            category_info[DALIGenericIterator.DATA_TAG] = \
-                [(x.shape(), np.dtype(x.dtype())) for x in category_tensors[DALIGenericIterator.DATA_TAG]]
-            # For labels we squeeze the tensors
-            category_tensors[DALIGenericIterator.LABEL_TAG] = \
-                [x.as_tensor() for x in category_outputs[DALIGenericIterator.LABEL_TAG]]
-            if self._squeeze_labels:
-                for label in category_tensors[DALIGenericIterator.LABEL_TAG]:
-                    label.squeeze()
-            category_info[DALIGenericIterator.LABEL_TAG] = \
-                [(x.shape(), np.dtype(x.dtype())) for x in category_tensors[DALIGenericIterator.LABEL_TAG]]
-
-            # If we did not yet allocate memory for that batch, do it now
-            if self._data_batches[i][self._current_data_batch] is None:
-                mx_gpu_device = mx.gpu(self._pipes[i].device_id)
-                mx_cpu_device = mx.cpu(0)
-                from nvidia.dali.backend import TensorGPU
-                category_device = {key : [] for key in self._output_categories}
-                for category in self._output_categories:
-                    for t in category_tensors[category]:
-                        if type(t) is TensorGPU:
-                            category_device[category].append(mx_gpu_device)
-                        else:
-                            category_device[category].append(mx_cpu_device)
-                d = []
-                l = []
-                for j, (shape, dtype) in enumerate(category_info[DALIGenericIterator.DATA_TAG]):
-                    d.append(mx.nd.zeros(shape, category_device[DALIGenericIterator.DATA_TAG][j], dtype = dtype))
-                for j, (shape, dtype) in enumerate(category_info[DALIGenericIterator.LABEL_TAG]):
-                    l.append(mx.nd.zeros(shape, category_device[DALIGenericIterator.LABEL_TAG][j], dtype = dtype))
-
-                self._data_batches[i][self._current_data_batch] = mx.io.DataBatch(data=d, label=l)
-
-            d = self._data_batches[i][self._current_data_batch].data
-            l = self._data_batches[i][self._current_data_batch].label
-            # Copy data from DALI Tensors to MXNet NDArrays
-            if self._dynamic_shape:
-                for j, (shape, dtype) in enumerate(category_info[DALIGenericIterator.DATA_TAG]):
-                    if list(d[j].shape) != shape:
-                        d[j] = mx.nd.zeros(shape, d[j].context, dtype = dtype)
-                for j, (shape, dtype) in enumerate(category_info[DALIGenericIterator.LABEL_TAG]):
-                    if list(l[j].shape) != shape:
-                        l[j] = mx.nd.zeros(shape, l[j].context, dtype = dtype)
-
-            for j, d_arr in enumerate(d):
-                feed_ndarray(category_tensors[DALIGenericIterator.DATA_TAG][j], d_arr)
-            for j, l_arr in enumerate(l):
-                feed_ndarray(category_tensors[DALIGenericIterator.LABEL_TAG][j], l_arr)
-
-        for p in self._pipes:
-            with p._check_api_type_scope(types.PipelineAPIType.ITERATOR) as check:
-                p.release_outputs()
-                p.schedule_run()
-
-        copy_db_index = self._current_data_batch
-        # Change index for double buffering
-        self._current_data_batch = (self._current_data_batch + 1) % 1
+        # The batch returned previously is no longer valid, so it can be refilled
+        if self._consumed_slot is not None:
+            self._free_slots.release()
+            self._consumed_slot = None
+        copy_db_index = self._get_ready_slot()
+        self._consumed_slot = copy_db_index
         self._counter += self._num_gpus * self.batch_size
 
         # padding the last batch
         if (not self._fill_last_batch) and (self._counter > self._size):
-                # this is the last batch and we need to pad
-                overflow = self._counter - self._size
-                overflow_per_device = overflow // self._num_gpus
-                difference = self._num_gpus - (overflow % self._num_gpus)
-                for i in range(self._num_gpus):
-                    if i < difference:
-                        self._data_batches[i][copy_db_index].pad = overflow_per_device
-                    else:
-                        self._data_batches[i][copy_db_index].pad = overflow_per_device + 1
+            # this is the last batch and we need to pad
+            overflow = self._counter - self._size
+            overflow_per_device = overflow // self._num_gpus
+            difference = self._num_gpus - (overflow % self._num_gpus)
+            pads = [overflow_per_device + (0 if i < difference else 1) for i in range(self._num_gpus)]
         else:
-            for db in self._data_batches:
-                db[copy_db_index].pad = 0
+            pads = [0] * self._num_gpus
+        for db, pad in zip(self._data_batches, pads):
+            db[copy_db_index].pad = pad
 
         return [db[copy_db_index] for db in self._data_batches]
 
@@ -286,27 +508,75 @@ class DALIGenericIterator(object):
     def __iter__(self):
         return self
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __del__(self):
+        # __init__ might have failed before the executor was created.
+        # This can run on any thread that dropped the last reference,
+        # including the ones owned by the iterator, so do not wait for them
+        if not getattr(self, "_closed", True):
+            self._shutdown(wait=False)
+
+    def close(self):
+        """
+        Releases the resources held by the iterator: its worker threads, the NDArrays
+        the outputs are copied to and the references to the pipelines, so DALI can free
+        their buffers once the pipelines are no longer used anywhere else.
+        The iterator cannot be used after it is closed.
+        """
+        if not self._closed:
+            self._shutdown(wait=True)
+
+    def _shutdown(self, wait):
+        self._closed = True
+        if self._prefetch_thread is not None:
+            # Wake the prefetching thread up wherever it waits
+            self._requests.put(None)
+            self._free_slots.release()
+            if wait:
+                self._prefetch_thread.join()
+        self._executor.shutdown(wait=wait)
+        self._peeked_outputs = [None] * self._num_gpus
+        self._data_batches = [[None] * self._ring_depth for i in range(self._num_gpus)]
+        self._data_arrays = [[None] * self._ring_depth for i in range(self._num_gpus)]
+        self._data_ptrs = [[None] * self._ring_depth for i in range(self._num_gpus)]
+        self._pipes = []
+
     def reset(self):
         """
         Resets the iterator after the full epoch.
         DALI iterators do not support resetting before the end of the epoch
-        and will ignore such request.
+        and will ignore such request, unless the epoch was interrupted by an error
+        raised when producing the data. Then the iterator starts a new epoch.
+        When more than one pipeline is used, the pipelines which did not fail
+        are not rewound, so after such recovery they may be ahead of the failed ones.
         """
-        if self._counter >= self._size:
-            if self._fill_last_batch and not self._last_batch_padded:
+        if self._closed:
+            raise RuntimeError("Cannot reset the closed DALI iterator")
+        if self._counter >= self._size or self._error is not None:
+            if self._error is None and self._fill_last_batch and not self._last_batch_padded:
                 self._counter = self._counter % self._size
             else:
                 self._counter = 0
+            self._error = None
             for p in self._pipes:
                 p.reset()
                 if p.empty():
                     with p._check_api_type_scope(types.PipelineAPIType.ITERATOR) as check:
                         p.schedule_run()
+            self._requests.put(self._batches_left())
         else:
             logging.warning("DALI iterator does not support resetting while epoch is not finished. Ignoring...")
 
     DATA_TAG = "data"
     LABEL_TAG = "label"
+    # Whether NDArrays for the outputs residing in the CPU memory should be allocated
+    # in the page-locked memory. Set to False if MXNet build does not support it.
+    USE_PINNED_CPU_MEMORY = True
 
 class DALIClassificationIterator(DALIGenericIterator):
     """
@@ -371,6 +641,10 @@ class DALIClassificationIterator(DALIGenericIterator):
                  the next epoch. If set to False next epoch will end sooner as data from
                  it was consumed but dropped. If set to True next epoch would be the
                  same length as the first one.
+    prefetch_queue_depth : int, optional, default = 2
+                 Number of data batches kept by the iterator for every pipeline.
+                 The iterator prepares up to `prefetch_queue_depth - 1` batches
+                 ahead of the one returned last. Has to be at least 1.
 
     Example
     -------
@@ -390,7 +664,8 @@ class DALIClassificationIterator(DALIGenericIterator):
                  auto_reset=False,
                  squeeze_labels=True,
                  dynamic_shape=False,
-                 last_batch_padded=False):
+                 last_batch_padded=False,
+                 prefetch_queue_depth=2):
         super(DALIClassificationIterator, self).__init__(pipelines,
                                                          [(data_name, DALIClassificationIterator.DATA_TAG),
                                                           (label_name, DALIClassificationIterator.LABEL_TAG)],
@@ -400,4 +675,5 @@ class DALIClassificationIterator(DALIGenericIterator):
                                                          auto_reset = auto_reset,
                                                          squeeze_labels=squeeze_labels,
                                                          dynamic_shape=dynamic_shape,
-                                                         last_batch_padded = last_batch_padded)
+                                                         last_batch_padded = last_batch_padded,
+                                                         prefetch_queue_depth = prefetch_queue_depth)
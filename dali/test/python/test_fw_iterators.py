@@ -290,3 +290,161 @@ def test_stop_iteration():
                 for batch_size in [1, 10 ,100]:
                     for auto_reset in [True, False]:
                         yield check_stop_iter, fw_iter, iter_name, batch_size, epochs, iter_num, auto_reset
+
+def test_mxnet_iterator_double_buffering():
+    batch_size = 10
+    pipe = TestIterPipeline(batch_size, 0, TestIterator(4, batch_size))
+    loader = MXNetIterator(pipe, [("data", MXNetIterator.DATA_TAG)], size=pipe.size)
+    first = next(loader)
+    second = next(loader)
+    third = next(loader)
+    assert first[0].data[0] is not second[0].data[0]
+    assert first[0].data[0] is third[0].data[0]
+
+class GrowingShapeIterator(TestIterator):
+    def __next__(self):
+        if self.i < self.n:
+            batch = [np.arange(0, 10 + self.i, dtype=np.uint8) for _ in range(self.batch_size)]
+            self.i += 1
+            return batch
+        else:
+            self.i = 0
+            raise StopIteration
+    next = __next__
+
+def test_mxnet_iterator_dynamic_shape():
+    batch_size = 10
+    iter_num = 5
+    pipe = TestIterPipeline(batch_size, 0, GrowingShapeIterator(iter_num, batch_size))
+    loader = MXNetIterator(pipe, [("data", MXNetIterator.DATA_TAG)], size=pipe.size,
+                           dynamic_shape=True)
+    count = 0
+    for batch in loader:
+        # every batch is wider than the one kept in the same slot before
+        expected = np.stack([np.arange(0, 10 + count, dtype=np.uint8)] * batch_size)
+        assert np.array_equal(batch[0].data[0].asnumpy(), expected)
+        count += 1
+    assert count == iter_num
+    loader.close()
+
+class TestIterPipelineCPUGPU(TestIterPipeline):
+    def define_graph(self,):
+        data = TestIterPipeline.define_graph(self)
+        return data, data.gpu()
+
+def test_mxnet_feed_ndarray_list():
+    from nvidia.dali.plugin.mxnet import feed_ndarray
+    batch_size = 10
+    pipe = TestIterPipelineCPUGPU(batch_size, 0, TestIterator(1, batch_size))
+    pipe.build()
+    cpu_out, gpu_out = pipe.run()
+    tensors = [cpu_out.as_tensor(), gpu_out.as_tensor()]
+    shape = tuple(tensors[0].shape())
+    arrs = [mxnet.nd.zeros(shape, mxnet.cpu(), dtype=np.uint8),
+            mxnet.nd.zeros(shape, mxnet.gpu(0), dtype=np.uint8)]
+    feed_ndarray(tensors, arrs)
+    expected = np.stack([np.arange(0, 10, dtype=np.uint8)] * batch_size)
+    for arr in arrs:
+        assert np.array_equal(arr.asnumpy(), expected)
+
+def test_mxnet_iterator_context_manager():
+    batch_size = 10
+    iter_num = 5
+    pipe = TestIterPipeline(batch_size, 0, TestIterator(iter_num, batch_size))
+    count = 0
+    with MXNetIterator(pipe, [("data", MXNetIterator.DATA_TAG)], size=pipe.size) as loader:
+        for _ in loader:
+            count += 1
+    assert count == iter_num
+    # closing already closed iterator is a no-op
+    loader.close()
+
+def test_mxnet_iterator_close_mid_epoch():
+    batch_size = 10
+    pipe = TestIterPipeline(batch_size, 0, TestIterator(5, batch_size))
+    loader = MXNetIterator(pipe, [("data", MXNetIterator.DATA_TAG)], size=pipe.size)
+    next(loader)
+    next(loader)
+    loader.close()
+    assert not loader._prefetch_thread.is_alive()
+
+class FailingOnceIterator(TestIterator):
+    def __init__(self, n, batch_size, fail_at):
+        TestIterator.__init__(self, n, batch_size)
+        self.fail_at = fail_at
+        self.failed = False
+
+    def __next__(self):
+        if not self.failed and self.i == self.fail_at:
+            self.failed = True
+            raise RuntimeError("Data source failure")
+        return TestIterator.__next__(self)
+    next = __next__
+
+def check_mxnet_iterator_error_propagation(num_pipes):
+    batch_size = 10
+    iter_num = 10
+    # only the first pipeline fails, the rest keep producing data
+    pipes = [TestIterPipeline(batch_size, 0, FailingOnceIterator(iter_num, batch_size, fail_at=4))]
+    pipes += [TestIterPipeline(batch_size, 0, TestIterator(iter_num, batch_size))
+              for _ in range(num_pipes - 1)]
+    loader = MXNetIterator(pipes, [("data", MXNetIterator.DATA_TAG)],
+                           size=pipes[0].size * num_pipes)
+    errors = 0
+    for _ in range(iter_num):
+        try:
+            next(loader)
+        except RuntimeError:
+            errors += 1
+    # the epoch is interrupted by the error, which is reported until reset
+    assert errors > 1
+    loader.reset()
+    batch = next(loader)
+    assert len(batch) == num_pipes
+    for b in batch:
+        assert b.data[0].shape == (batch_size, 10)
+    loader.close()
+
+def test_mxnet_iterator_error_propagation():
+    for num_pipes in [1, 2]:
+        yield check_mxnet_iterator_error_propagation, num_pipes
+
+def check_mxnet_iterator_use_after_close(prefetch_queue_depth):
+    batch_size = 10
+    pipe = TestIterPipeline(batch_size, 0, TestIterator(5, batch_size))
+    loader = MXNetIterator(pipe, [("data", MXNetIterator.DATA_TAG)], size=pipe.size,
+                           prefetch_queue_depth=prefetch_queue_depth)
+    next(loader)
+    loader.close()
+    for call in [lambda: next(loader), loader.reset]:
+        try:
+            call()
+            assert False, "Using closed iterator should fail"
+        except RuntimeError:
+            pass
+
+def test_mxnet_iterator_use_after_close():
+    for prefetch_queue_depth in [1, 2]:
+        yield check_mxnet_iterator_use_after_close, prefetch_queue_depth
+
+def check_mxnet_iterator_prefetch_queue_depth(prefetch_queue_depth, epochs, iter_num):
+    batch_size = 10
+    pipe = TestIterPipeline(batch_size, 0, TestIterator(iter_num, batch_size))
+    loader = MXNetIterator(pipe, [("data", MXNetIterator.DATA_TAG)], size=pipe.size,
+                           prefetch_queue_depth=prefetch_queue_depth)
+    arrays = set()
+    count = 0
+    for e in range(epochs):
+        for batch in loader:
+            arrays.add(id(batch[0].data[0]))
+            count += 1
+        loader.reset()
+    assert count == iter_num * epochs
+    assert len(arrays) == min(prefetch_queue_depth, iter_num * epochs)
+    loader.close()
+
+def test_mxnet_iterator_prefetch_queue_depth():
+    for prefetch_queue_depth in [1, 2, 3]:
+        for epochs in [1, 3]:
+            for iter_num in [2, 5]:
+                yield check_mxnet_iterator_prefetch_queue_depth, prefetch_queue_depth, epochs, iter_num